@@ -3,6 +3,8 @@ from __future__ import annotations
 import argparse
 import json
 import logging
+import signal
+import sys
 import time
 from dataclasses import asdict, dataclass
 from datetime import datetime, timezone
@@ -12,12 +14,29 @@ from typing import Any, Dict, Iterable, List, Optional, Tuple
 import ccxt
 import requests
 
+from utils.monitor import BotTelemetry
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
 logger = logging.getLogger("arbitrage_bot")
 
+# Без __dict__ у экземпляров: котировок и связок создаются тысячи за цикл.
+_SLOTS: Dict[str, Any] = {"slots": True} if sys.version_info >= (3, 10) else {}
 
-@dataclass
+_IDENTIFIERS: Dict[str, str] = {}
+_UPPER_IDENTIFIERS: Dict[str, str] = {}
+
+
+def intern_identifier(value: str, upper: bool = False) -> str:
+    """Один общий экземпляр строки на идентификатор (symbol/source/fiat/market_type)."""
+    cache = _UPPER_IDENTIFIERS if upper else _IDENTIFIERS
+    interned = cache.get(value)
+    if interned is None:
+        interned = sys.intern(value.upper() if upper else value)
+        cache[value] = interned
+    return interned
+
+
+@dataclass(**_SLOTS)
 class Quote:
     symbol: str
     source: str
@@ -26,10 +45,23 @@ class Quote:
     ask: float
     volume_quote: float = 0.0
     fiat: str = "USDT"
-    ts: float = 0.0
+    ts: float = 0.0  # локальное время получения ответа
+    exchange_ts: float = 0.0  # время котировки на площадке (0 — площадка его не отдаёт)
+
+    @property
+    def event_ts(self) -> float:
+        """Лучшая оценка момента, к которому относится котировка."""
+        return self.exchange_ts or self.ts
 
+    def __post_init__(self) -> None:
+        # Нормализация один раз при сборе: дальше symbol/fiat уже в верхнем регистре.
+        self.symbol = intern_identifier(self.symbol, upper=True)
+        self.source = intern_identifier(self.source)
+        self.market_type = intern_identifier(self.market_type)
+        self.fiat = intern_identifier(self.fiat, upper=True)
 
-@dataclass
+
+@dataclass(**_SLOTS)
 class Opportunity:
     symbol: str
     buy_source: str
@@ -42,9 +74,12 @@ class Opportunity:
     fiat: str
     market_type_buy: str
     market_type_sell: str
+    leg_skew_sec: float = 0.0
+    observed_ts: float = 0.0
+    skew_flagged: bool = False
 
 
-@dataclass
+@dataclass(**_SLOTS)
 class Signal:
     opportunity: Opportunity
     validation_passed: bool
@@ -54,9 +89,15 @@ class Signal:
 class CoinCapUniverseClient:
     URL = "https://api.coincap.io/v2/assets"
 
+    def __init__(self, telemetry: Optional[BotTelemetry] = None):
+        self.telemetry = telemetry
+
     def get_symbols(self, limit: int = 30) -> List[str]:
         try:
-            response = requests.get(self.URL, params={"limit": limit}, timeout=10)
+            with requests.Session() as session:
+                response = session.get(self.URL, params={"limit": limit}, timeout=10)
+                if self.telemetry:
+                    self.telemetry.sample_sockets("coincap", session)
             response.raise_for_status()
             payload = response.json()
             assets = payload.get("data", [])
@@ -67,26 +108,40 @@ class CoinCapUniverseClient:
 
 
 class CEXCollector:
-    def __init__(self, exchange_ids: Iterable[str], quote_asset: str, min_quote_volume: float = 0.0):
+    def __init__(
+        self,
+        exchange_ids: Iterable[str],
+        quote_asset: str,
+        min_quote_volume: float = 0.0,
+        telemetry: Optional[BotTelemetry] = None,
+    ):
         self.exchange_ids = list(exchange_ids)
         self.quote_asset = quote_asset.upper()
         self.min_quote_volume = float(min_quote_volume)
+        self.telemetry = telemetry
+
+    def _collect_batch(
+        self, exchange: ccxt.Exchange, symbols: List[str]
+    ) -> Dict[str, Tuple[Dict[str, Any], float]]:
+        """Пытаемся взять тикеры батчем, иначе fallback на fetch_ticker по одному.
 
-    def _collect_batch(self, exchange: ccxt.Exchange, symbols: List[str]) -> Dict[str, Dict[str, Any]]:
-        """Пытаемся взять тикеры батчем, иначе fallback на fetch_ticker по одному."""
+        Возвращает {symbol: (ticker, локальное время получения)}.
+        """
         if not symbols:
             return {}
         try:
             if exchange.has.get("fetchTickers"):
                 tickers = exchange.fetch_tickers(symbols)
-                return {k: v for k, v in tickers.items() if isinstance(v, dict)}
+                received_at = time.time()
+                return {k: (v, received_at) for k, v in tickers.items() if isinstance(v, dict)}
         except Exception as exc:
             logger.debug("fetch_tickers fallback на %s: %s", exchange.id, exc)
 
-        result: Dict[str, Dict[str, Any]] = {}
+        result: Dict[str, Tuple[Dict[str, Any], float]] = {}
         for symbol in symbols:
             try:
-                result[symbol] = exchange.fetch_ticker(symbol)
+                # С enableRateLimit запросы идут с паузами: время получения у каждого своё
+                result[symbol] = (exchange.fetch_ticker(symbol), time.time())
             except Exception:
                 continue
         return result
@@ -107,8 +162,11 @@ class CEXCollector:
                 exchange.load_markets()
                 symbols = [f"{base}/{self.quote_asset}" for base in base_symbols if f"{base}/{self.quote_asset}" in exchange.markets]
                 tickers = self._collect_batch(exchange, symbols)
+                if self.telemetry:
+                    # Соединения ещё открыты: фиксируем пиковое число сокетов на площадку
+                    self.telemetry.sample_sockets(exchange_id, exchange.session)
 
-                for market_symbol, ticker in tickers.items():
+                for market_symbol, (ticker, received_at) in tickers.items():
                     bid = ticker.get("bid")
                     ask = ticker.get("ask")
                     if not bid or not ask:
@@ -116,7 +174,7 @@ class CEXCollector:
                     volume_quote = float(ticker.get("quoteVolume") or 0.0)
                     if volume_quote < self.min_quote_volume:
                         continue
-                    base = market_symbol.split("/")[0].upper()
+                    base = market_symbol.split("/")[0]
                     quotes.append(
                         Quote(
                             symbol=base,
@@ -126,7 +184,8 @@ class CEXCollector:
                             ask=float(ask),
                             volume_quote=volume_quote,
                             fiat=self.quote_asset,
-                            ts=time.time(),
+                            ts=received_at,
+                            exchange_ts=float(ticker.get("timestamp") or 0.0) / 1000,
                         )
                     )
             except Exception as exc:
@@ -142,15 +201,29 @@ class CEXCollector:
 class DexScreenerCollector:
     URL = "https://api.dexscreener.com/latest/dex/search"
 
-    def __init__(self, quote_assets: Optional[List[str]] = None, min_liquidity_usd: float = 0.0):
+    def __init__(
+        self,
+        quote_assets: Optional[List[str]] = None,
+        min_liquidity_usd: float = 0.0,
+        telemetry: Optional[BotTelemetry] = None,
+    ):
         self.quote_assets = {asset.upper() for asset in (quote_assets or ["USDT", "USDC"])}
         self.min_liquidity_usd = float(min_liquidity_usd)
+        self.telemetry = telemetry
 
     def collect(self, base_symbols: Iterable[str]) -> List[Quote]:
+        # Одна сессия на проход: keep-alive соединения живы до закрытия, их и считает телеметрия.
+        with requests.Session() as session:
+            quotes = self._collect(session, base_symbols)
+            if self.telemetry:
+                self.telemetry.sample_sockets("dexscreener", session)
+        return quotes
+
+    def _collect(self, session: requests.Session, base_symbols: Iterable[str]) -> List[Quote]:
         quotes: List[Quote] = []
         for base in [symbol.upper() for symbol in base_symbols]:
             try:
-                response = requests.get(self.URL, params={"q": base}, timeout=12)
+                response = session.get(self.URL, params={"q": base}, timeout=12)
                 response.raise_for_status()
                 pairs = response.json().get("pairs", [])
 
@@ -192,7 +265,12 @@ class DexScreenerCollector:
 class BybitP2PCollector:
     URL = "https://api2.bybit.com/fiat/otc/item/online"
 
-    def _request_side_prices(self, token: str, side: str, amount_rub: int, size: int) -> List[float]:
+    def __init__(self, telemetry: Optional[BotTelemetry] = None):
+        self.telemetry = telemetry
+
+    def _request_side_prices(
+        self, session: requests.Session, token: str, side: str, amount_rub: int, size: int
+    ) -> List[float]:
         payload = {
             "tokenId": token,
             "currencyId": "RUB",
@@ -203,17 +281,26 @@ class BybitP2PCollector:
             "authMaker": False,
             "canTrade": False,
         }
-        response = requests.post(self.URL, json=payload, timeout=15)
+        response = session.post(self.URL, json=payload, timeout=15)
         response.raise_for_status()
         items = (((response.json() or {}).get("result") or {}).get("items") or [])
         return [float(item.get("price")) for item in items if item.get("price")]
 
     def collect_rub(self, base_symbols: Iterable[str], amount_rub: int = 30000, size: int = 20) -> List[Quote]:
+        with requests.Session() as session:
+            quotes = self._collect_rub(session, base_symbols, amount_rub, size)
+            if self.telemetry:
+                self.telemetry.sample_sockets("bybit_p2p", session)
+        return quotes
+
+    def _collect_rub(
+        self, session: requests.Session, base_symbols: Iterable[str], amount_rub: int, size: int
+    ) -> List[Quote]:
         quotes: List[Quote] = []
         for token in [symbol.upper() for symbol in base_symbols]:
             try:
-                ask_prices = self._request_side_prices(token=token, side="1", amount_rub=amount_rub, size=size)
-                bid_prices = self._request_side_prices(token=token, side="0", amount_rub=amount_rub, size=size)
+                ask_prices = self._request_side_prices(session, token=token, side="1", amount_rub=amount_rub, size=size)
+                bid_prices = self._request_side_prices(session, token=token, side="0", amount_rub=amount_rub, size=size)
                 if not ask_prices or not bid_prices:
                     continue
 
@@ -241,14 +328,24 @@ class ArbitrageEngine:
         slippage_percent: float,
         min_profit_percent: float,
         fx_rates_to_usdt: Optional[Dict[str, float]] = None,
+        max_leg_skew_sec: float = 0.0,
+        leg_skew_action: str = "reject",
     ):
         self.taker_fee_percent = float(taker_fee_percent)
         self.slippage_percent = float(slippage_percent)
         self.min_profit_percent = float(min_profit_percent)
-        self.fx_rates_to_usdt = {"USDT": 1.0, "USD": 1.0, **(fx_rates_to_usdt or {})}
+        # 0 — без проверки рассинхронизации ног; action: reject | flag
+        self.max_leg_skew_sec = float(max_leg_skew_sec)
+        if leg_skew_action not in ("reject", "flag"):
+            raise ValueError(f"leg_skew_action должен быть reject или flag: {leg_skew_action}")
+        self.leg_skew_action = leg_skew_action
+        self.fx_rates_to_usdt = {
+            fiat.upper(): rate for fiat, rate in {"USDT": 1.0, "USD": 1.0, **(fx_rates_to_usdt or {})}.items()
+        }
 
     def _normalize_price(self, price: float, fiat: str) -> Optional[float]:
-        rate = self.fx_rates_to_usdt.get(fiat.upper())
+        # fiat уже нормализован в Quote
+        rate = self.fx_rates_to_usdt.get(fiat)
         if not rate:
             return None
         return price * rate
@@ -256,7 +353,7 @@ class ArbitrageEngine:
     def _quote_pairs(self, quotes: Iterable[Quote]) -> Dict[Tuple[str, str], List[Quote]]:
         grouped: Dict[Tuple[str, str], List[Quote]] = {}
         for quote in quotes:
-            grouped.setdefault((quote.symbol, quote.fiat.upper()), []).append(quote)
+            grouped.setdefault((quote.symbol, quote.fiat), []).append(quote)
         return grouped
 
     def find(self, quotes: Iterable[Quote], allow_cross_fiat: bool = False) -> List[Opportunity]:
@@ -272,6 +369,7 @@ class ArbitrageEngine:
         else:
             candidate_groups = [(symbol, fiat, items) for (symbol, fiat), items in groups.items()]
 
+        fees = 2 * self.taker_fee_percent
         for symbol, fiat, items in candidate_groups:
             for buy in items:
                 for sell in items:
@@ -284,7 +382,7 @@ class ArbitrageEngine:
                     sell_bid = sell.bid
                     result_fiat = fiat
 
-                    if allow_cross_fiat and buy.fiat.upper() != sell.fiat.upper():
+                    if allow_cross_fiat and buy.fiat != sell.fiat:
                         buy_norm = self._normalize_price(buy.ask, buy.fiat)
                         sell_norm = self._normalize_price(sell.bid, sell.fiat)
                         if buy_norm is None or sell_norm is None:
@@ -292,15 +390,27 @@ class ArbitrageEngine:
                         buy_ask = buy_norm
                         sell_bid = sell_norm
                         result_fiat = "USDT"
-                    elif buy.fiat.upper() != sell.fiat.upper():
+                    elif buy.fiat != sell.fiat:
                         continue
 
                     gross = ((sell_bid - buy_ask) / buy_ask) * 100
-                    fees = 2 * self.taker_fee_percent
                     net = gross - fees - self.slippage_percent
                     if net < self.min_profit_percent:
                         continue
 
+                    buy_ts = buy.event_ts
+                    sell_ts = sell.event_ts
+                    # Сравниваем только часы одного типа: время площадок, иначе локальное время получения.
+                    if buy.exchange_ts and sell.exchange_ts:
+                        leg_skew = abs(buy.exchange_ts - sell.exchange_ts)
+                    elif buy.ts and sell.ts:
+                        leg_skew = abs(buy.ts - sell.ts)
+                    else:
+                        leg_skew = 0.0
+                    skew_flagged = 0 < self.max_leg_skew_sec < leg_skew
+                    if skew_flagged and self.leg_skew_action == "reject":
+                        continue
+
                     opportunities.append(
                         Opportunity(
                             symbol=symbol,
@@ -314,6 +424,9 @@ class ArbitrageEngine:
                             fiat=result_fiat,
                             market_type_buy=buy.market_type,
                             market_type_sell=sell.market_type,
+                            leg_skew_sec=leg_skew,
+                            observed_ts=max(buy_ts, sell_ts),
+                            skew_flagged=skew_flagged,
                         )
                     )
 
@@ -404,41 +517,56 @@ def load_config(path: str) -> Dict[str, Any]:
         return json.load(file)
 
 
-def prepare_symbols(scanner_cfg: Dict[str, Any]) -> List[str]:
+def prepare_symbols(scanner_cfg: Dict[str, Any], telemetry: Optional[BotTelemetry] = None) -> List[str]:
     symbols = [symbol.upper() for symbol in scanner_cfg.get("symbols", [])]
 
     if scanner_cfg.get("use_coincap_universe", True):
-        universe = CoinCapUniverseClient().get_symbols(limit=int(scanner_cfg.get("coincap_limit", 30)))
+        universe = CoinCapUniverseClient(telemetry).get_symbols(limit=int(scanner_cfg.get("coincap_limit", 30)))
         if universe:
             return [symbol for symbol in (symbols or universe) if symbol in set(universe)]
 
     return symbols
 
 
-def run_once(config: Dict[str, Any]) -> List[Opportunity]:
-    scanner_cfg = config["scanner"]
-    symbols = prepare_symbols(scanner_cfg)
+def run_once(config: Dict[str, Any], telemetry: Optional[BotTelemetry] = None) -> List[Opportunity]:
+    telemetry = telemetry or BotTelemetry(enabled=False)
+    telemetry.begin_cycle()
+    try:
+        return _run_cycle(config, telemetry)
+    finally:
+        telemetry.end_cycle()
+
 
-    cex_quotes = CEXCollector(
-        exchange_ids=scanner_cfg.get("cex_exchanges", ["mexc", "bybit", "bitget"]),
-        quote_asset=scanner_cfg.get("quote_asset", "USDT"),
-        min_quote_volume=float(scanner_cfg.get("min_quote_volume", 0)),
-    ).collect(symbols)
+def _run_cycle(config: Dict[str, Any], telemetry: BotTelemetry) -> List[Opportunity]:
+    scanner_cfg = config["scanner"]
+    with telemetry.stage("universe"):
+        symbols = prepare_symbols(scanner_cfg, telemetry)
+
+    with telemetry.stage("cex"):
+        cex_quotes = CEXCollector(
+            exchange_ids=scanner_cfg.get("cex_exchanges", ["mexc", "bybit", "bitget"]),
+            quote_asset=scanner_cfg.get("quote_asset", "USDT"),
+            min_quote_volume=float(scanner_cfg.get("min_quote_volume", 0)),
+            telemetry=telemetry,
+        ).collect(symbols)
 
     dex_quotes: List[Quote] = []
     if scanner_cfg.get("enable_dex", True):
-        dex_quotes = DexScreenerCollector(
-            quote_assets=scanner_cfg.get("dex_quote_assets", ["USDT", "USDC"]),
-            min_liquidity_usd=float(scanner_cfg.get("dex_min_liquidity_usd", 0)),
-        ).collect(symbols)
+        with telemetry.stage("dex"):
+            dex_quotes = DexScreenerCollector(
+                quote_assets=scanner_cfg.get("dex_quote_assets", ["USDT", "USDC"]),
+                min_liquidity_usd=float(scanner_cfg.get("dex_min_liquidity_usd", 0)),
+                telemetry=telemetry,
+            ).collect(symbols)
 
     p2p_quotes: List[Quote] = []
     if scanner_cfg.get("enable_p2p_rub", True):
-        p2p_quotes = BybitP2PCollector().collect_rub(
-            base_symbols=scanner_cfg.get("p2p_symbols", ["USDT", "BTC", "ETH"]),
-            amount_rub=int(scanner_cfg.get("p2p_amount_rub", 30000)),
-            size=int(scanner_cfg.get("p2p_page_size", 20)),
-        )
+        with telemetry.stage("p2p"):
+            p2p_quotes = BybitP2PCollector(telemetry).collect_rub(
+                base_symbols=scanner_cfg.get("p2p_symbols", ["USDT", "BTC", "ETH"]),
+                amount_rub=int(scanner_cfg.get("p2p_amount_rub", 30000)),
+                size=int(scanner_cfg.get("p2p_page_size", 20)),
+            )
 
     quotes = cex_quotes + dex_quotes + p2p_quotes
     logger.info("Собрано котировок: %s", len(quotes))
@@ -448,8 +576,26 @@ def run_once(config: Dict[str, Any]) -> List[Opportunity]:
         slippage_percent=float(scanner_cfg.get("slippage_percent", 0.2)),
         min_profit_percent=float(scanner_cfg.get("min_profit_percent", 0.5)),
         fx_rates_to_usdt=scanner_cfg.get("fx_rates_to_usdt", {"RUB": 0.0105}),
+        max_leg_skew_sec=float(scanner_cfg.get("max_leg_skew_sec", 0)),
+        leg_skew_action=scanner_cfg.get("leg_skew_action", "reject"),
+    )
+    now = time.time()
+    for quote in quotes:
+        telemetry.observe("quote_age", now - quote.event_ts, quote.source)
+
+    with telemetry.stage("engine"):
+        opportunities = engine.find(quotes, allow_cross_fiat=bool(scanner_cfg.get("allow_cross_fiat", False)))
+
+    telemetry.observe_lifetimes(
+        "opportunity_lifetime",
+        {
+            (item.symbol, item.buy_source, item.sell_source, item.fiat): (
+                f"{item.buy_source}->{item.sell_source}",
+                item.observed_ts or now,
+            )
+            for item in opportunities
+        },
     )
-    opportunities = engine.find(quotes, allow_cross_fiat=bool(scanner_cfg.get("allow_cross_fiat", False)))
 
     quote_index = {(quote.symbol, quote.source): quote for quote in quotes}
     validator = PreTradeValidator(
@@ -469,17 +615,27 @@ def run_once(config: Dict[str, Any]) -> List[Opportunity]:
         opportunities = []
 
     signals: List[Signal] = []
-    for opportunity in opportunities:
-        ok, reasons = validator.validate(opportunity, quote_index)
-        signals.append(Signal(opportunity=opportunity, validation_passed=ok, validation_reasons=reasons))
+    with telemetry.stage("validate"):
+        for opportunity in opportunities:
+            ok, reasons = validator.validate(opportunity, quote_index)
+            signals.append(Signal(opportunity=opportunity, validation_passed=ok, validation_reasons=reasons))
 
     signals = [signal for signal in signals if signal.validation_passed]
     signals = risk_manager.trim_signals(signals)
     opportunities = [signal.opportunity for signal in signals]
 
+    now = time.time()
+    for opportunity in opportunities:
+        if opportunity.observed_ts:
+            telemetry.observe(
+                "signal_latency",
+                now - opportunity.observed_ts,
+                f"{opportunity.buy_source}->{opportunity.sell_source}",
+            )
+
     for opportunity in opportunities[: int(scanner_cfg.get("print_top", 20))]:
         logger.info(
-            "%s [%s] | buy %s %.6f -> sell %s %.6f | net=%.3f%%",
+            "%s [%s] | buy %s %.6f -> sell %s %.6f | net=%.3f%% | skew=%.1fs%s",
             opportunity.symbol,
             opportunity.fiat,
             opportunity.buy_source,
@@ -487,6 +643,8 @@ def run_once(config: Dict[str, Any]) -> List[Opportunity]:
             opportunity.sell_source,
             opportunity.sell_price,
             opportunity.net_percent,
+            opportunity.leg_skew_sec,
+            " (рассинхрон ног)" if opportunity.skew_flagged else "",
         )
 
     output_path = Path(scanner_cfg.get("output", "data/trades/opportunities_latest.json"))
@@ -510,19 +668,22 @@ def main() -> None:
 
     config = load_config(args.config)
     interval_sec = int(config.get("scanner", {}).get("interval_sec", 120))
+    telemetry = BotTelemetry.from_config(config.get("telemetry", {}))
+    if hasattr(signal, "SIGUSR1"):
+        # kill -USR1 <pid>: снять профиль следующего цикла
+        signal.signal(signal.SIGUSR1, lambda *_: telemetry.request_profile())
 
     if args.once:
-        run_once(config)
+        run_once(config, telemetry)
         return
 
     while True:
         try:
-            run_once(config)
+            run_once(config, telemetry)
         except Exception as exc:
             logger.exception("Ошибка цикла: %s", exc)
         time.sleep(interval_sec)
 
 
 if __name__ == "__main__":
-    main()me__ == "__main__":
     main()
@@ -1,3 +1,6 @@
+import sys
+from dataclasses import asdict
+
 from arbitrage_bot import ArbitrageEngine, PreTradeValidator, Quote, RiskManager
 
 
@@ -59,6 +62,80 @@ def test_engine_cross_fiat_with_fx_enabled():
     assert opportunities[0].fiat == "USDT"
 
 
+def test_quote_normalized_once_and_asdict_compatible():
+    first = Quote(symbol="btc", source="mexc", market_type="cex", bid=1.0, ask=1.1, fiat="usdt")
+    second = Quote(symbol="BTC", source="".join(["me", "xc"]), market_type="cex", bid=1.0, ask=1.1, fiat="USDT")
+
+    assert first.symbol == "BTC" and first.fiat == "USDT"
+    assert first.source is second.source
+    assert first.fiat is second.fiat
+    if sys.version_info >= (3, 10):
+        assert not hasattr(first, "__dict__")
+    assert asdict(first) == {
+        "symbol": "BTC",
+        "source": "mexc",
+        "market_type": "cex",
+        "bid": 1.0,
+        "ask": 1.1,
+        "volume_quote": 0.0,
+        "fiat": "USDT",
+        "ts": 0.0,
+        "exchange_ts": 0.0,
+    }
+
+
+def test_engine_groups_mixed_case_fiat():
+    engine = ArbitrageEngine(taker_fee_percent=0.1, slippage_percent=0.2, min_profit_percent=0.5)
+    quotes = [
+        Quote(symbol="BTC", source="mexc", market_type="cex", bid=100.0, ask=100.2, fiat="usdt"),
+        Quote(symbol="BTC", source="bybit", market_type="cex", bid=102.0, ask=102.2, fiat="USDT"),
+    ]
+
+    opportunities = engine.find(quotes)
+
+    assert [item.buy_source for item in opportunities] == ["mexc"]
+    assert opportunities[0].fiat == "USDT"
+
+
+def test_engine_rejects_legs_out_of_sync():
+    engine = ArbitrageEngine(
+        taker_fee_percent=0.1, slippage_percent=0.2, min_profit_percent=0.5, max_leg_skew_sec=2
+    )
+    quotes = [
+        Quote(symbol="BTC", source="mexc", market_type="cex", bid=100.0, ask=100.2, ts=1010.0, exchange_ts=1000.0),
+        Quote(symbol="BTC", source="bybit", market_type="cex", bid=102.0, ask=102.2, ts=1010.5, exchange_ts=1009.0),
+    ]
+
+    assert engine.find(quotes) == []
+
+
+def test_engine_compares_receive_times_when_a_leg_has_no_exchange_ts():
+    engine = ArbitrageEngine(
+        taker_fee_percent=0.1,
+        slippage_percent=0.2,
+        min_profit_percent=0.5,
+        max_leg_skew_sec=2,
+        leg_skew_action="flag",
+    )
+    in_sync = [
+        Quote(symbol="BTC", source="mexc", market_type="cex", bid=100.0, ask=100.2, ts=1005.0, exchange_ts=1000.0),
+        Quote(symbol="BTC", source="dex:a", market_type="dex", bid=102.0, ask=102.2, ts=1004.0),
+    ]
+    out_of_sync = [
+        Quote(symbol="BTC", source="mexc", market_type="cex", bid=100.0, ask=100.2, ts=1010.0, exchange_ts=1009.5),
+        Quote(symbol="BTC", source="dex:a", market_type="dex", bid=102.0, ask=102.2, ts=1004.0),
+    ]
+
+    synced = engine.find(in_sync)[0]
+    flagged = engine.find(out_of_sync)[0]
+
+    assert synced.buy_source == "mexc"
+    assert not synced.skew_flagged
+    assert synced.leg_skew_sec == 1.0
+    assert flagged.skew_flagged
+    assert flagged.leg_skew_sec == 6.0
+
+
 def test_pretrade_validator_blocks_unrealistic_spread_and_source():
     validator = PreTradeValidator(min_quote_volume=1000, max_spread_percent=20, blocked_sources=["badex"])
     opportunity = ArbitrageEngine(0.1, 0.1, 0.1).find(
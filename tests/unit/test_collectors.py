@@ -0,0 +1,119 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import ccxt
+import psutil
+
+from arbitrage_bot import CEXCollector, DexScreenerCollector
+from utils.monitor import BotTelemetry
+
+
+def test_cex_collector_converts_exchange_timestamp_to_seconds(monkeypatch):
+    class StubExchange:
+        has = {"fetchTickers": True}
+        markets = {"BTC/USDT": {}, "ETH/USDT": {}, "SOL/USDT": {}}
+        urls = {"api": {}}
+
+        def __init__(self, config):
+            pass
+
+        def load_markets(self):
+            return self.markets
+
+        def fetch_tickers(self, symbols):
+            return {
+                "BTC/USDT": {"bid": 100.0, "ask": 100.1, "quoteVolume": 1, "timestamp": 1700000000123},
+                "ETH/USDT": {"bid": 10.0, "ask": 10.1, "quoteVolume": 1, "timestamp": None},
+                "SOL/USDT": {"bid": 1.0, "ask": 1.1, "quoteVolume": 1},
+            }
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(ccxt, "stubex", StubExchange, raising=False)
+    monkeypatch.setattr("arbitrage_bot.time.time", lambda: 1700000005.0)
+
+    quotes = {quote.symbol: quote for quote in CEXCollector(["stubex"], "USDT").collect(["BTC", "ETH", "SOL"])}
+
+    assert quotes["BTC"].exchange_ts == 1700000000.123
+    assert quotes["BTC"].event_ts == 1700000000.123
+    assert quotes["ETH"].exchange_ts == 0.0
+    assert quotes["SOL"].exchange_ts == 0.0
+    assert quotes["SOL"].event_ts == 1700000005.0
+    assert all(quote.ts == 1700000005.0 for quote in quotes.values())
+
+
+def test_cex_collector_fallback_records_receive_time_per_ticker(monkeypatch):
+    clock = {"now": 1000.0}
+
+    class StubExchange:
+        has = {"fetchTickers": False}
+        markets = {"BTC/USDT": {}, "ETH/USDT": {}}
+
+        def __init__(self, config):
+            pass
+
+        def load_markets(self):
+            return self.markets
+
+        def fetch_ticker(self, symbol):
+            # Пауза rate limit перед каждым запросом
+            clock["now"] += 2.0
+            return {"bid": 1.0, "ask": 1.1, "quoteVolume": 1, "timestamp": None}
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(ccxt, "stubex", StubExchange, raising=False)
+    monkeypatch.setattr("arbitrage_bot.time.time", lambda: clock["now"])
+
+    quotes = {quote.symbol: quote for quote in CEXCollector(["stubex"], "USDT").collect(["BTC", "ETH"])}
+
+    assert quotes["BTC"].ts == 1002.0
+    assert quotes["ETH"].ts == 1004.0
+
+
+def test_dex_collector_samples_sockets_while_session_is_open():
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            body = json.dumps(
+                {"pairs": [{"quoteToken": {"symbol": "USDT"}, "priceUsd": "100", "liquidity": {"usd": 1}, "dexId": "a"}]}
+            ).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    class RecordingTelemetry(BotTelemetry):
+        def sample_sockets(self, venue, session):
+            # Клиентский сокет отличаем от принятого сервером по удалённому порту
+            self.client_sockets = sum(
+                1
+                for conn in psutil.Process().net_connections(kind="tcp")
+                if conn.raddr and conn.raddr.port == server.server_port and conn.status == psutil.CONN_ESTABLISHED
+            )
+            return super().sample_sockets(venue, session)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    telemetry = RecordingTelemetry(log_path="")
+    try:
+        collector = DexScreenerCollector(telemetry=telemetry)
+        collector.URL = f"http://127.0.0.1:{server.server_port}/search"
+
+        quotes = collector.collect(["BTC", "ETH"])
+    finally:
+        telemetry.close()
+        server.shutdown()
+        server.server_close()
+
+    assert [quote.source for quote in quotes] == ["dex:a", "dex:a"]
+    assert telemetry.client_sockets == 1
+    assert telemetry.sockets["dexscreener"] == 1
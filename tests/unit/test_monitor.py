@@ -0,0 +1,151 @@
+import gc
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import requests
+
+from utils.monitor import BotTelemetry, Histogram
+
+
+def test_telemetry_records_stages_and_gc(tmp_path):
+    log_path = tmp_path / "telemetry_{date}.json"
+    telemetry = BotTelemetry(log_path=str(log_path))
+    try:
+        telemetry.begin_cycle()
+        with telemetry.stage("engine"):
+            gc.collect()
+        report = telemetry.end_cycle()
+    finally:
+        telemetry.close()
+
+    assert set(report["stages"]) == {"engine"}
+    assert report["stages"]["engine"]["rss_mb"] > 0
+    assert report["gc"]["collections"] >= 1
+    assert "total" in report["sockets"]
+
+    written = list(tmp_path.glob("telemetry_*.json"))
+    assert len(written) == 1
+    assert json.loads(written[0].read_text(encoding="utf-8").splitlines()[0])["stages"]
+
+
+def test_disabled_telemetry_is_noop():
+    telemetry = BotTelemetry(enabled=False)
+    telemetry.begin_cycle()
+    with telemetry.stage("cex"):
+        pass
+
+    assert telemetry.end_cycle() == {}
+    assert telemetry.stages == {}
+
+
+def test_requested_profile_is_dumped_as_collapsed_stacks(tmp_path):
+    telemetry = BotTelemetry(log_path="", profile_interval_ms=1, profile_dir=str(tmp_path))
+    try:
+        telemetry.request_profile()
+        telemetry.begin_cycle()
+        deadline = time.perf_counter() + 0.05
+        while time.perf_counter() < deadline:
+            sum(range(1000))
+        report = telemetry.end_cycle()
+    finally:
+        telemetry.close()
+
+    lines = Path(report["profile_path"]).read_text(encoding="utf-8").splitlines()
+    assert lines
+    stack, count = lines[0].rsplit(" ", 1)
+    assert "test_requested_profile_is_dumped_as_collapsed_stacks" in stack
+    assert int(count) > 0
+
+
+def test_profiles_dumped_in_the_same_second_do_not_overwrite(tmp_path):
+    telemetry = BotTelemetry(log_path="", profile_interval_ms=1, profile_dir=str(tmp_path))
+    try:
+        for _ in range(2):
+            telemetry.request_profile()
+            telemetry.begin_cycle()
+            telemetry.end_cycle()
+    finally:
+        telemetry.close()
+
+    assert len(list(tmp_path.glob("cycle_*.collapsed"))) == 2
+
+
+def test_histogram_quantiles_and_buckets():
+    histogram = Histogram(bounds=(1, 5, 10))
+    for value in (0.5, 0.7, 3, 4, 50):
+        histogram.observe(value)
+
+    snapshot = histogram.snapshot()
+
+    assert snapshot["count"] == 5
+    assert snapshot["p50"] == 5
+    assert snapshot["p95"] == 50
+    assert snapshot["buckets"] == {"<=1": 2, "<=5": 2, ">10": 1}
+
+
+def test_opportunity_lifetime_recorded_when_it_disappears():
+    telemetry = BotTelemetry(log_path="")
+    try:
+        key = ("BTC", "mexc", "bybit", "USDT")
+        telemetry.observe_lifetimes("opportunity_lifetime", {key: ("mexc->bybit", 100.0)}, now=100.0)
+        telemetry.observe_lifetimes("opportunity_lifetime", {key: ("mexc->bybit", 220.0)}, now=220.0)
+        telemetry.observe_lifetimes("opportunity_lifetime", {}, now=340.0)
+    finally:
+        telemetry.close()
+
+    lower = telemetry.histograms["opportunity_lifetime"]["mexc->bybit"]
+    upper = telemetry.histograms["opportunity_lifetime_max"]["mexc->bybit"]
+    assert lower.count == 1
+    assert lower.max == 120.0
+    assert upper.max == 240.0
+
+
+def test_single_cycle_opportunity_has_zero_lower_bound_lifetime():
+    telemetry = BotTelemetry(log_path="")
+    try:
+        key = ("ETH", "mexc", "bybit", "USDT")
+        telemetry.observe_lifetimes("opportunity_lifetime", {key: ("mexc->bybit", 100.0)}, now=100.0)
+        telemetry.observe_lifetimes("opportunity_lifetime", {}, now=220.0)
+    finally:
+        telemetry.close()
+
+    assert telemetry.histograms["opportunity_lifetime"]["mexc->bybit"].max == 0.0
+    assert telemetry.histograms["opportunity_lifetime_max"]["mexc->bybit"].max == 120.0
+
+
+def test_sockets_attributed_to_owning_session_not_remote_address():
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/"
+    telemetry = BotTelemetry(log_path="")
+    try:
+        # Обе площадки за одним адресом: каждая видит только свои соединения
+        with requests.Session() as first, requests.Session() as second:
+            first.get(url, timeout=5)
+            first.get(url, timeout=5)
+            second.get(url, timeout=5)
+            telemetry.sample_sockets("first", first)
+            telemetry.sample_sockets("second", second)
+        closed = telemetry.sample_sockets("closed", first)
+    finally:
+        telemetry.close()
+        server.shutdown()
+        server.server_close()
+
+    assert telemetry.sockets == {"first": 1, "second": 1, "closed": 0}
+    assert closed == 0
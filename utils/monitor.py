@@ -2,16 +2,23 @@
 """
 Мониторинг системы и уведомления
 """
-import psutil
+import gc
 import json
+import logging
+import os
+import sys
+import threading
 import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
 from datetime import datetime
-import logging
+from pathlib import Path
+
+import psutil
+
+logger = logging.getLogger(__name__)
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
 
 class SystemMonitor:
     def __init__(self):
@@ -20,15 +27,21 @@ class SystemMonitor:
             'memory_percent': 85,
             'disk_percent': 90
         }
+        self.process = psutil.Process()
+        # Первый вызов без интервала только задаёт точку отсчёта
+        psutil.cpu_percent(interval=None)
+        self.process.cpu_percent(interval=None)
     
     def check_resources(self):
-        """Проверка системных ресурсов"""
+        """Проверка системных ресурсов (без блокирующего ожидания)"""
         stats = {
             'timestamp': datetime.now().isoformat(),
-            'cpu_percent': psutil.cpu_percent(interval=1),
+            'cpu_percent': psutil.cpu_percent(interval=None),
             'memory_percent': psutil.virtual_memory().percent,
             'disk_percent': psutil.disk_usage('/').percent,
-            'network_io': psutil.net_io_counters()._asdict()
+            'network_io': psutil.net_io_counters()._asdict(),
+            'process_rss_mb': self.process.memory_info().rss / 1048576,
+            'process_cpu_percent': self.process.cpu_percent(interval=None),
         }
         
         # Проверка порогов
@@ -43,7 +56,7 @@ class SystemMonitor:
             alerts.append(f"Disk usage high: {stats['disk_percent']}%")
         
         if alerts:
-            logging.warning(" | ".join(alerts))
+            logger.warning(" | ".join(alerts))
         
         return stats, alerts
     
@@ -55,9 +68,369 @@ class SystemMonitor:
             with open(filename, 'a') as f:
                 f.write(json.dumps(stats) + '\n')
         except Exception as e:
-            logging.error(f"Ошибка записи лога: {e}")
+            logger.error(f"Ошибка записи лога: {e}")
+
+
+class SamplingProfiler:
+    """Сэмплирующий профилировщик потока в формате collapsed stacks (flamegraph.pl, speedscope)"""
+
+    def __init__(self, interval_sec=0.01):
+        self.interval_sec = float(interval_sec)
+        self.samples = Counter()
+        self._thread = None
+        self._stop = threading.Event()
+        self._target_id = None
+        # Подпись кадра считается один раз на code object
+        self._labels = {}
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self, thread_id=None):
+        if self._thread is not None:
+            return
+        self._target_id = thread_id if thread_id is not None else threading.get_ident()
+        self.samples = Counter()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval_sec):
+            self.sample()
+
+    def sample(self):
+        """Один снимок стека целевого потока"""
+        frame = sys._current_frames().get(self._target_id)
+        if frame is None:
+            return
+        labels = self._labels
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            label = labels.get(code)
+            if label is None:
+                label = labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            stack.append(label)
+            frame = frame.f_back
+        stack.reverse()
+        self.samples[';'.join(stack)] += 1
+
+    def dump(self, path):
+        """Сохранение профиля: одна строка `frame;frame;... count` на стек"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+class Histogram:
+    """Гистограмма длительностей (секунды) с фиксированными границами корзин"""
+
+    BOUNDS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+    def __init__(self, bounds=BOUNDS):
+        self.bounds = tuple(bounds)
+        self.buckets = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        value = max(float(value), 0.0)
+        index = 0
+        while index < len(self.bounds) and value > self.bounds[index]:
+            index += 1
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """Верхняя граница корзины, в которую попадает квантиль q"""
+        if not self.count:
+            return 0.0
+        threshold = q * self.count
+        seen = 0
+        for index, bucket in enumerate(self.buckets):
+            seen += bucket
+            if seen >= threshold and bucket:
+                return min(self.bounds[index], self.max) if index < len(self.bounds) else self.max
+        return self.max
+
+    def snapshot(self):
+        labels = [f"<={bound}" for bound in self.bounds] + [f">{self.bounds[-1]}"]
+        return {
+            'count': self.count,
+            'mean': round(self.total / self.count, 3) if self.count else 0.0,
+            'p50': round(self.quantile(0.5), 3),
+            'p95': round(self.quantile(0.95), 3),
+            'max': round(self.max, 3),
+            'buckets': {label: bucket for label, bucket in zip(labels, self.buckets) if bucket},
+        }
+
+
+class BotTelemetry:
+    """Телеметрия процесса бота: стадии цикла, сокеты по площадкам, паузы GC, tracemalloc, профиль"""
+
+    def __init__(
+        self,
+        enabled=True,
+        log_path='logs/system/telemetry_{date}.json',
+        tracemalloc_top=0,
+        profile_slow_cycle_sec=0.0,
+        profile_interval_ms=10,
+        profile_dir='logs/profiles',
+    ):
+        self.enabled = bool(enabled)
+        self.log_path = log_path
+        self.tracemalloc_top = int(tracemalloc_top)
+        self.profile_slow_cycle_sec = float(profile_slow_cycle_sec)
+        self.profile_dir = Path(profile_dir)
+        self.profiler = SamplingProfiler(interval_sec=float(profile_interval_ms) / 1000)
+        self.process = psutil.Process()
+        self._profile_requested = False
+        self._profiles_dumped = 0
+        self._gc_started = None
+        # Гистограммы накапливаются за всё время работы процесса: {метрика: {метка: Histogram}}
+        self.histograms = {}
+        self._alive = {}
+        self._reset_cycle()
+
+        if self.enabled:
+            gc.callbacks.append(self._on_gc)
+            if self.tracemalloc_top > 0 and not tracemalloc.is_tracing():
+                tracemalloc.start(1)
+
+    @classmethod
+    def from_config(cls, telemetry_cfg):
+        return cls(
+            enabled=telemetry_cfg.get('enabled', True),
+            log_path=telemetry_cfg.get('log_path', 'logs/system/telemetry_{date}.json'),
+            tracemalloc_top=telemetry_cfg.get('tracemalloc_top', 0),
+            profile_slow_cycle_sec=telemetry_cfg.get('profile_slow_cycle_sec', 0),
+            profile_interval_ms=telemetry_cfg.get('profile_interval_ms', 10),
+            profile_dir=telemetry_cfg.get('profile_dir', 'logs/profiles'),
+        )
+
+    def close(self):
+        if self._on_gc in gc.callbacks:
+            gc.callbacks.remove(self._on_gc)
+        self.profiler.stop()
+
+    def _reset_cycle(self):
+        self.stages = {}
+        self.sockets = {}
+        self.gc_stats = {'collections': 0, 'pause_total_ms': 0.0, 'pause_max_ms': 0.0}
+        self._cycle_started = None
+        self._cycle_cpu_started = None
+
+    def _on_gc(self, phase, info):
+        if phase == 'start':
+            self._gc_started = time.perf_counter()
+        elif self._gc_started is not None:
+            pause_ms = (time.perf_counter() - self._gc_started) * 1000
+            self._gc_started = None
+            self.gc_stats['collections'] += 1
+            self.gc_stats['pause_total_ms'] += pause_ms
+            if pause_ms > self.gc_stats['pause_max_ms']:
+                self.gc_stats['pause_max_ms'] = pause_ms
+
+    def observe(self, name, value_sec, label='all'):
+        """Добавляет длительность в гистограмму метрики `name` с меткой (обычно площадка)"""
+        if not self.enabled:
+            return
+        per_label = self.histograms.setdefault(name, {})
+        histogram = per_label.get(label)
+        if histogram is None:
+            histogram = per_label[label] = Histogram()
+        histogram.observe(value_sec)
+
+    def observe_lifetimes(self, name, active, now=None):
+        """
+        Время жизни объектов, видимых несколько циклов подряд (например, связок).
+        `active` — {ключ: (метка, момент наблюдения)} для текущего цикла. Для исчезнувших
+        ключей в `name` пишется нижняя оценка (последнее наблюдение − первое), в
+        `{name}_max` — верхняя (момент, когда ключ не найден, − первое наблюдение).
+        """
+        if not self.enabled:
+            return
+        now = time.time() if now is None else now
+        alive = self._alive.setdefault(name, {})
+        for key, (label, first_seen, last_seen) in alive.items():
+            if key not in active:
+                self.observe(name, last_seen - first_seen, label)
+                self.observe(f"{name}_max", now - first_seen, label)
+        tracked = {}
+        for key, (label, seen_at) in active.items():
+            first_seen = alive[key][1] if key in alive else seen_at
+            tracked[key] = (label, first_seen, seen_at)
+        self._alive[name] = tracked
+
+    def request_profile(self):
+        """Снять профиль следующего цикла независимо от его длительности (например, по SIGUSR1)"""
+        self._profile_requested = True
+
+    def sample_sockets(self, venue, session):
+        """
+        Открытые соединения в пуле сессии площадки (`requests.Session` коллектора
+        или `exchange.session` ccxt); за цикл хранится пиковое значение.
+        """
+        if not self.enabled:
+            return 0
+        count = _session_sockets(session)
+        self.sockets[venue] = max(count, self.sockets.get(venue, 0))
+        return count
+
+    def _sample_total_sockets(self):
+        try:
+            connections = self.process.net_connections(kind='tcp')
+        except (psutil.Error, AttributeError):
+            try:
+                connections = self.process.connections(kind='tcp')
+            except psutil.Error:
+                return
+        total = sum(1 for conn in connections if conn.raddr)
+        self.sockets['total'] = max(total, self.sockets.get('total', 0))
+
+    def begin_cycle(self):
+        if not self.enabled:
+            return
+        self._reset_cycle()
+        self._cycle_started = time.perf_counter()
+        self._cycle_cpu_started = time.process_time()
+        if self._profile_requested or self.profile_slow_cycle_sec > 0:
+            self.profiler.start(threading.get_ident())
+
+    @contextmanager
+    def stage(self, name):
+        """Замер стадии цикла: время, CPU процесса и RSS на выходе"""
+        if not self.enabled:
+            yield
+            return
+        wall_started = time.perf_counter()
+        cpu_started = time.process_time()
+        try:
+            yield
+        finally:
+            wall_sec = time.perf_counter() - wall_started
+            cpu_sec = time.process_time() - cpu_started
+            self.stages[name] = {
+                'wall_ms': round(wall_sec * 1000, 3),
+                'cpu_ms': round(cpu_sec * 1000, 3),
+                'cpu_percent': round(cpu_sec / wall_sec * 100, 1) if wall_sec > 0 else 0.0,
+                'rss_mb': round(self.process.memory_info().rss / 1048576, 2),
+            }
+            self._sample_total_sockets()
+
+    def end_cycle(self):
+        """Завершает цикл, пишет отчёт в лог и при необходимости сохраняет профиль"""
+        if not self.enabled or self._cycle_started is None:
+            return {}
+        wall_sec = time.perf_counter() - self._cycle_started
+        cpu_sec = time.process_time() - self._cycle_cpu_started
+
+        report = {
+            'timestamp': datetime.now().isoformat(),
+            'cycle_wall_ms': round(wall_sec * 1000, 3),
+            'cycle_cpu_ms': round(cpu_sec * 1000, 3),
+            'rss_mb': round(self.process.memory_info().rss / 1048576, 2),
+            'stages': self.stages,
+            'sockets': self.sockets,
+            'gc': {key: round(value, 3) for key, value in self.gc_stats.items()},
+            'latency': {
+                name: {label: histogram.snapshot() for label, histogram in per_label.items()}
+                for name, per_label in self.histograms.items()
+            },
+        }
+
+        if self.tracemalloc_top > 0 and tracemalloc.is_tracing():
+            statistics = tracemalloc.take_snapshot().statistics('lineno')[: self.tracemalloc_top]
+            report['top_allocations'] = [
+                {'location': str(stat.traceback), 'size_kb': round(stat.size / 1024, 1), 'count': stat.count}
+                for stat in statistics
+            ]
+
+        if self.profiler.running:
+            self.profiler.stop()
+            slow = 0 < self.profile_slow_cycle_sec <= wall_sec
+            if self._profile_requested or slow:
+                self._profiles_dumped += 1
+                stamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')[:-3]
+                name = f"cycle_{stamp}_{os.getpid()}_{self._profiles_dumped}.collapsed"
+                path = self.profiler.dump(self.profile_dir / name)
+                report['profile_path'] = str(path)
+                logger.warning("Профиль цикла %.2f с сохранён: %s", wall_sec, path)
+            self._profile_requested = False
+
+        logger.info(
+            "Телеметрия: цикл %.0f мс, CPU %.0f мс, RSS %.1f МБ, GC %d (max %.1f мс)",
+            report['cycle_wall_ms'],
+            report['cycle_cpu_ms'],
+            report['rss_mb'],
+            self.gc_stats['collections'],
+            self.gc_stats['pause_max_ms'],
+        )
+        quote_age = self.histograms.get('quote_age', {})
+        if quote_age:
+            logger.info(
+                "Возраст котировок p95: %s",
+                ", ".join(
+                    f"{label}={histogram.quantile(0.95):.1f}с"
+                    for label, histogram in sorted(quote_age.items(), key=lambda item: -item[1].quantile(0.95))
+                ),
+            )
+        self._write_report(report)
+        return report
+
+    def _write_report(self, report):
+        if not self.log_path:
+            return
+        path = Path(self.log_path.format(date=datetime.now().strftime('%Y%m%d')))
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(report, ensure_ascii=False) + '\n')
+        except Exception as e:
+            logger.error(f"Ошибка записи телеметрии: {e}")
+
+
+def _session_sockets(session):
+    """Число подключённых соединений в пулах urllib3 сессии requests (соединения, свободные в пуле)"""
+    count = 0
+    for adapter in getattr(session, 'adapters', {}).values():
+        managers = [getattr(adapter, 'poolmanager', None), *getattr(adapter, 'proxy_manager', {}).values()]
+        for manager in managers:
+            if manager is None:
+                continue
+            for key in list(manager.pools.keys()):
+                try:
+                    pool = manager.pools[key]
+                except KeyError:
+                    continue
+                for conn in list(getattr(getattr(pool, 'pool', None), 'queue', ())):
+                    sock = getattr(conn, 'sock', None)
+                    if sock is not None and sock.fileno() != -1:
+                        count += 1
+    return count
+
 
 def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
     monitor = SystemMonitor()
     
     print("📊 Мониторинг системы запущен")